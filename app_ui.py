@@ -1,19 +1,51 @@
 """User interface components for YouTube Tasks Browser application."""
 
+import asyncio
+import logging
+from functools import lru_cache, partial
 from random import shuffle
-import re
 from datetime import datetime, timezone
-from dateutil.relativedelta import relativedelta
-from dateutil.parser import parse as parse_date
 
-from nicegui import ui
+from nicegui import ui, app as ng_app
 
-from utils import calculate_duration_seconds
+from utils import calculate_duration_seconds, parse_duration
+
+logger = logging.getLogger(__name__)
+
+# Number of video cards built between yields to the event loop
+CARDS_PER_CHUNK = 20
+
+# Quiet period before a sort change is applied
+SORT_DEBOUNCE_SECONDS = 0.05
+
+# Buckets for relative_time, largest first (months and years approximated)
+_TIME_UNITS = (
+    (365 * 86400, "year"),
+    (30 * 86400, "month"),
+    (86400, "day"),
+    (3600, "hour"),
+    (60, "minute"),
+)
+
+# Preferences kept for everyone when no storage secret is configured
+_shared_preferences = {}
+
+
+def user_preferences():
+    """
+    Return the storage for per-user preferences such as the sort choice.
+
+    app.storage.user needs a storage_secret in ui.run(); without one, fall
+    back to an in-memory dict shared by all visitors.
+    """
+    if ng_app.storage.secret is None:
+        return _shared_preferences
+    return ng_app.storage.user
 
 
 def create_video_card(video_info, task_info):
-    """Create a card displaying video and task information."""
-    with ui.card().classes("w-full max-w-sm"):
+    """Create a card displaying video and task information and return it."""
+    with ui.card().classes("w-full max-w-sm") as card:
         # Thumbnail section
         ui.image(video_info["thumbnail"]["url"]).classes("w-full")
 
@@ -22,7 +54,7 @@ def create_video_card(video_info, task_info):
             # Video title
             ui.link(
                 text=video_info["title"],
-                target=f'https://youtube.com/watch?v={task_info["youtube_ids"][0]}',
+                target=video_info["watch_url"],
                 new_tab=True,
             ).classes("font-bold flex-grow")
 
@@ -32,11 +64,11 @@ def create_video_card(video_info, task_info):
                     ui.label("Channel: ")
                     ui.link(
                         text=video_info["channel"],
-                        target=f'https://www.youtube.com/channel/{video_info["channelId"]}',
+                        target=video_info["channel_url"],
                         new_tab=True,
                     )
-                ui.label(f'Duration: {parse_duration(video_info["duration"])}')
-                ui.label(f'Published: {relative_time(video_info["publishedAt"])}')
+                ui.label(f'Duration: {video_info["duration_str"]}')
+                ui.label(f'Published: {video_info["published_str"]}')
                 ui.separator()
                 ui.label(f'Task List: {task_info["task_list"]}')
 
@@ -47,7 +79,8 @@ def create_video_card(video_info, task_info):
                         text="Open in Google Tasks",
                         target=task_info["task_url"],
                         new_tab=True,
-                    ).tooltip("Open in Google Tasks")
+                    )
+    return card
 
 
 def show_credentials_instructions():
@@ -87,56 +120,217 @@ async def show_login_ui(app, request):
 
 def format_duration(total_seconds):
     """Convert total seconds to a simplified human-readable format."""
-    hours, remainder = divmod(total_seconds, 3600)
-    return f"{hours}+h" if remainder > 0 else f"{hours}h"
+    hours = total_seconds // 3600
+    return f"{hours}+h" if total_seconds % 3600 else f"{hours}h"
+
+
+def annotate_video_details(video_details):
+    """
+    Store derived URL, duration and publish fields on each video, once per fetch.
+
+    Returns:
+        The total duration of all videos in seconds
+    """
+    total_seconds = 0
+    for video_id, video in video_details.items():
+        video["watch_url"] = "https://youtube.com/watch?v=" + video_id
+        video["channel_url"] = "https://www.youtube.com/channel/" + video["channelId"]
+        seconds = calculate_duration_seconds(video["duration"])
+        video["duration_seconds"] = seconds
+        video["duration_str"] = parse_duration(video["duration"])
+        video["published_str"] = relative_time(video["publishedAt"])
+        total_seconds += seconds
+    return total_seconds
+
+
+def annotate_tasks(tasks, video_details):
+    """
+    Store each task's videos that have details and drop tasks with none.
+
+    Returns:
+        The tasks that have at least one video in video_details
+    """
+    for task in tasks:
+        task["valid_youtube_ids"] = [
+            vid for vid in task["youtube_ids"] if vid in video_details
+        ]
+    return [task for task in tasks if task["valid_youtube_ids"]]
+
+
+def _first_video_keys(tasks, video_details, field):
+    """Sort keys from a lowercased field of each task's first valid video."""
+    # Lowercase each video's field once, not once per referencing task
+    video_keys = {vid: video[field].lower() for vid, video in video_details.items()}
+    return [video_keys[task["valid_youtube_ids"][0]] for task in tasks]
+
+
+def _task_list_keys(tasks, _video_details):
+    """Sort keys from each task's list name."""
+    return [task["task_list"].lower() for task in tasks]
+
+
+def _duration_keys(tasks, video_details):
+    """Sort keys from the total duration of each task's valid videos."""
+    # Project to a flat dict so each lookup is a single C-level __getitem__
+    seconds = {vid: video["duration_seconds"] for vid, video in video_details.items()}
+    return [sum(map(seconds.__getitem__, task["valid_youtube_ids"])) for task in tasks]
+
+
+# Sort criteria mapped to functions building one key per task
+_SORT_KEYS = {
+    "Alphabetical": partial(_first_video_keys, field="title"),
+    "Task List": _task_list_keys,
+    "Duration": _duration_keys,
+    "Channel": partial(_first_video_keys, field="channel"),
+}
 
 
 def sort_tasks(tasks, video_details, criteria):
-    """Sort tasks based on the given criteria."""
-    print("Sorting tasks by:", criteria)
-    if criteria == "Alphabetical":
-
-        def get_video_title(task):
-            try:
-                # Get first available video that exists in video_details
-                for vid_id in task["youtube_ids"]:
-                    if vid_id in video_details:
-                        return video_details[vid_id]["title"].lower()
-                return ""  # Fallback if no valid videos found
-            except (KeyError, IndexError):
-                return ""
-
-        tasks.sort(key=get_video_title)
-    elif criteria == "Task List":
-        tasks.sort(key=lambda task: task["task_list"].lower())
-    elif criteria == "Duration":
-
-        def get_total_duration(task):
-            try:
-                return sum(
-                    calculate_duration_seconds(video_details[vid]["duration"])
-                    for vid in task["youtube_ids"]
-                    if vid in video_details
-                )
-            except (KeyError, TypeError):
-                return 0
-
-        tasks.sort(key=get_total_duration)
-    elif criteria == "Channel":
-
-        def get_channel(task):
-            try:
-                # Get first available video that exists in video_details
-                for vid_id in task["youtube_ids"]:
-                    if vid_id in video_details:
-                        return video_details[vid_id]["channel"].lower()
-                return ""  # Fallback if no valid videos found
-            except (KeyError, IndexError):
-                return ""
-
-        tasks.sort(key=get_channel)
-    elif criteria == "Shuffle":
+    """
+    Sort tasks in place based on the given criteria.
+
+    Tasks must have been passed through annotate_tasks first.
+    """
+    logger.debug("Sorting tasks by: %s", criteria)
+    if criteria == "Shuffle":
         shuffle(tasks)
+        return
+
+    build_keys = _SORT_KEYS.get(criteria)
+    if build_keys is None:
+        return
+    keys = build_keys(tasks, video_details)
+
+    # Sort positions by the precomputed keys. sorted() is stable, and the
+    # bound keys.__getitem__ avoids a Python-level key function entirely.
+    order = sorted(range(len(tasks)), key=keys.__getitem__)
+    tasks[:] = [tasks[i] for i in order]
+
+
+def first_task_per_video(tasks):
+    """
+    Map each video ID to the first task that links it, in task order.
+
+    A video linked from several tasks gets a single card, shown for the
+    first of those tasks.
+    """
+    video_tasks = {}
+    for task in tasks:
+        for video_id in task["valid_youtube_ids"]:
+            video_tasks.setdefault(video_id, task)
+    return video_tasks
+
+
+def video_order(tasks, video_tasks, criteria):
+    """
+    List video IDs in the order of the sorted tasks.
+
+    Each video goes where it first appears, except for the Task List sort,
+    which places it with the task its card shows so cards group under the
+    list they are labelled with.
+
+    Args:
+        tasks: Tasks in the order to display
+        video_tasks: Task shown on each video's card, from first_task_per_video
+        criteria: Sort criteria the tasks were sorted by
+    """
+    if criteria == "Task List":
+        return [
+            video_id
+            for task in tasks
+            for video_id in task["valid_youtube_ids"]
+            if video_tasks[video_id] is task
+        ]
+    return list(
+        dict.fromkeys(
+            video_id for task in tasks for video_id in task["valid_youtube_ids"]
+        )
+    )
+
+
+async def render_video_cards(grid, order, video_tasks, video_details, cards):
+    """
+    Fill the grid with one card per video, yielding to the event loop between chunks.
+
+    Each card is recorded in ``cards`` by video ID so later sort changes can
+    reorder the existing cards instead of rebuilding them.
+    """
+    with grid:
+        for count, video_id in enumerate(order, 1):
+            cards[video_id] = create_video_card(
+                video_details[video_id], video_tasks[video_id]
+            )
+            if count % CARDS_PER_CHUNK == 0:
+                # Yield so the outbox can ship this chunk to the browser
+                await asyncio.sleep(0)
+
+
+def reorder_video_cards(grid, order, cards):
+    """Reorder the existing cards in the grid to follow the given video order."""
+    # Permute the slot's children in place; a single update moves them client-side
+    grid.default_slot.children[:] = [cards[vid] for vid in order]
+    grid.update()
+
+
+class VideoGrid:  # pylint: disable=too-many-instance-attributes
+    """Grid of video cards that is built once and reordered on sort changes."""
+
+    def __init__(self):
+        self.grid = ui.grid().classes(
+            "w-full gap-6 grid-cols-1 md:grid-cols-2 lg:grid-cols-3 xl:grid-cols-4"
+        )
+        self.cards = {}
+        self.tasks = None
+        self.video_tasks = None
+        self.video_details = None
+        self.criteria = None
+        self._sort_version = 0
+        # Held while cards are built or moved, so a sort change never
+        # reorders a half-rendered grid
+        self._render_lock = asyncio.Lock()
+
+    async def load(self, tasks, video_details, criteria):
+        """Set the tasks and videos to show and render them sorted by criteria."""
+        self.tasks = tasks
+        # Pick each card's task once, so its label and link never change
+        self.video_tasks = first_task_per_video(tasks)
+        self.video_details = video_details
+        await self.update(criteria)
+
+    async def update(self, criteria):
+        """Apply a sort criteria, skipping no-op changes."""
+        if criteria == self.criteria:
+            return
+        # Remember the choice server-side; no JS round-trip needed
+        user_preferences()["sorting_criteria"] = criteria
+        if self.tasks is None:
+            return  # Still loading; load() applies the current selection
+        self.criteria = criteria
+        async with self._render_lock:
+            if criteria != self.criteria:
+                return  # A newer change arrived while the grid was rendering
+            sort_tasks(self.tasks, self.video_details, criteria)
+            order = video_order(self.tasks, self.video_tasks, criteria)
+            if self.cards:
+                reorder_video_cards(self.grid, order, self.cards)
+            else:
+                await render_video_cards(
+                    self.grid, order, self.video_tasks, self.video_details, self.cards
+                )
+
+    async def on_sort_change(self, criteria):
+        """Debounce sort changes so only the latest of a quick burst applies."""
+        self._sort_version += 1
+        version = self._sort_version
+        await asyncio.sleep(SORT_DEBOUNCE_SECONDS)
+        if version == self._sort_version:
+            await self.update(criteria)
+
+
+async def clear_video_cache(app):
+    """Forget cached video details so the next refresh fetches them again."""
+    await asyncio.to_thread(app.video_cache.clear)
+    ui.notify("Video cache cleared", type="info")
 
 
 def logout(app):
@@ -165,45 +359,31 @@ async def show_main_ui(app):
                 ui.button("Toggle Dark Mode", on_click=app.toggle_dark_mode).classes(
                     "bg-gray-500 text-white"
                 )
+                ui.button(
+                    "Clear Video Cache", on_click=lambda: clear_video_cache(app)
+                ).classes("bg-gray-500 text-white")
 
-            # Set the select's value to the cookie if available
-            sorting_value = app.sorting_criteria
-            print("Initial sorting:", sorting_value)
+            # Restore the user's last sort choice from server-side storage
+            sorting_value = user_preferences().get("sorting_criteria", "Alphabetical")
+            logger.debug("Initial sorting: %s", sorting_value)
             sorting_criteria = ui.select(
                 options=["Alphabetical", "Task List", "Duration", "Channel", "Shuffle"],
                 value=sorting_value,
                 label="Sort by",
-                on_change=lambda e: update_grid(e.value),
+                on_change=lambda e: video_grid.on_sort_change(e.value),
             )
 
         # Stats container (will be populated after data fetch)
         stats_container = ui.element("div").classes("w-full text-center mb-4")
 
-        # Grid container for videos
-        grid_container = ui.element("div")
-
-        async def update_grid(criteria):
-            """Update grid with new sorting."""
-            # Set a cookie whenever sorting changes
-            ui.run_javascript(f"document.cookie = 'sorting_criteria={criteria};path=/'")
-            grid_container.clear()
-            with grid_container:
-                with ui.grid().classes(
-                    "w-full gap-6 grid-cols-1 md:grid-cols-2 lg:grid-cols-3 xl:grid-cols-4"
-                ):
-                    sort_tasks(tasks, video_details, criteria)
-                    for task in tasks:
-                        valid_videos = [
-                            vid for vid in task["youtube_ids"] if vid in video_details
-                        ]
-                        if valid_videos:
-                            for video_id in valid_videos:
-                                create_video_card(video_details[video_id], task)
+        video_grid = VideoGrid()
 
         # Loading indicator
         loading = ui.spinner("dots", size="lg")
 
         try:
+            # Serve the page shell first; everything below streams over the socket
+            await ui.context.client.connected()
             tasks = await app.fetch_tasks_with_videos()
 
             if not tasks:
@@ -212,15 +392,16 @@ async def show_main_ui(app):
                 )
                 return
 
-            video_ids = list(set(vid for task in tasks for vid in task["youtube_ids"]))
+            # Order-preserving dedup keeps the fetch order stable across loads
+            video_ids = list(
+                {vid: None for task in tasks for vid in task["youtube_ids"]}
+            )
             video_details = await app.get_video_details(video_ids)
+            total_duration_seconds = annotate_video_details(video_details)
+            tasks = annotate_tasks(tasks, video_details)
 
             # Update stats display
             total_videos = len(video_ids)
-            total_duration_seconds = sum(
-                calculate_duration_seconds(video["duration"])
-                for video in video_details.values()
-            )
             total_duration = format_duration(total_duration_seconds)
 
             # Show stats in the dedicated container
@@ -230,7 +411,7 @@ async def show_main_ui(app):
                 ).classes("text-lg font-bold")
 
             # Initial grid creation
-            await update_grid(sorting_criteria.value)
+            await video_grid.load(tasks, video_details, sorting_criteria.value)
 
         except (ConnectionError, TimeoutError) as e:
             ui.notify(f"Network error: {str(e)}", type="negative")
@@ -248,39 +429,22 @@ async def show_main_ui(app):
             ).classes("text-blue-500 underline")
 
 
-def parse_duration(duration):
-    """Convert ISO 8601 duration to human readable format."""
-    match = re.match(r"PT(?:(\d+)H)?(?:(\d+)M)?(?:(\d+)S)?", duration)
-    if not match:
-        return "Unknown"
-
-    hours, minutes, seconds = match.groups()
-    parts = []
-
-    if hours:
-        parts.append(f"{hours}h")
-    if minutes:
-        parts.append(f"{minutes}m")
-    if seconds:
-        parts.append(f"{seconds}s")
-
-    return " ".join(parts)
+@lru_cache(maxsize=4096)
+def _parse_published(published_at):
+    """Parse a publishedAt timestamp; cached since many videos share one."""
+    # YouTube always sends strict RFC 3339 ("2024-01-15T12:34:56Z"); swapping
+    # the "Z" keeps this working on Python versions before 3.11
+    return datetime.fromisoformat(published_at.replace("Z", "+00:00"))
 
 
 def relative_time(published_at):
     """Convert a datetime to a summarized relative time string."""
     now = datetime.now(timezone.utc)
-    published_date = parse_date(published_at)
-    delta = relativedelta(now, published_date)
-
-    if delta.years > 0:
-        return f"{delta.years} year{'s' if delta.years > 1 else ''} ago"
-    if delta.months > 0:
-        return f"{delta.months} month{'s' if delta.months > 1 else ''} ago"
-    if delta.days > 0:
-        return f"{delta.days} day{'s' if delta.days > 1 else ''} ago"
-    if delta.hours > 0:
-        return f"{delta.hours} hour{'s' if delta.hours > 1 else ''} ago"
-    if delta.minutes > 0:
-        return f"{delta.minutes} minute{'s' if delta.minutes > 1 else ''} ago"
+    elapsed = int((now - _parse_published(published_at)).total_seconds())
+
+    # Report only the largest whole unit
+    for unit_seconds, unit in _TIME_UNITS:
+        count = elapsed // unit_seconds
+        if count > 0:
+            return f"{count} {unit}{'s' if count > 1 else ''} ago"
     return "just now"
@@ -8,21 +8,33 @@ and managing the interaction between Google Tasks and YouTube data.
 # Google API client is not liked by pylint
 # pylint: disable=maybe-no-member
 
-import re
+import asyncio
+import json
+import logging
 import pickle
-import base64
+import re
+import threading
+from functools import partial
+from datetime import datetime, timedelta, timezone
 from pathlib import Path
 import os
 
 import dotenv
+from google_auth_httplib2 import AuthorizedHttp
 from nicegui import ui, app as ng_app
 from google_auth_oauthlib.flow import Flow
+from google.auth.exceptions import RefreshError
 from google.auth.transport.requests import Request as GRequest
+from google.oauth2.credentials import Credentials
 from googleapiclient.discovery import build
+from googleapiclient.http import build_http
 from starlette.responses import RedirectResponse
 from fastapi import Request
 
 from app_ui import show_login_ui, show_main_ui
+from video_cache import VideoCache
+
+logger = logging.getLogger(__name__)
 
 # OAuth 2.0 configuration
 SCOPES = [
@@ -31,7 +43,97 @@ SCOPES = [
 ]
 
 
-class App:
+# Match watch, short-link, shorts, embed, v/, e/ and live URLs, capturing the
+# 11-character video ID. Scheme and host prefixes such as "https://www." or
+# "m." never change the capture, so the pattern starts on the literal host,
+# which lets re skip ahead quickly; the fixed-length ID bounds every attempt.
+_YOUTUBE_URL_RE = re.compile(
+    r"(?:youtube\.com/(?:watch\?v=|shorts/|embed/|v/|e/|live/)|youtu\.be/)"
+    r"([A-Za-z0-9_-]{11})(?![A-Za-z0-9_-])"
+)
+
+# Partial responses covering only the fields the app reads
+TASKLIST_FIELDS = "items(id,title),nextPageToken"
+TASK_FIELDS = "items(id,title,notes,status,due,webViewLink),nextPageToken"
+VIDEO_FIELDS = (
+    "items(id,snippet(title,thumbnails/medium,channelTitle,channelId,publishedAt),"
+    "contentDetails/duration)"
+)
+
+# Largest page tasks.list returns; its default is only 20 tasks. (tasklists.list
+# already defaults to its maximum of 1000 lists.)
+TASKS_PAGE_SIZE = 100
+
+# Most API requests to have in flight at once, to stay within Google's quotas
+MAX_CONCURRENT_REQUESTS = 8
+
+# Retries for rate-limited (429) and server-error (5xx) responses; the client
+# library waits with randomized exponential backoff between attempts
+MAX_RETRIES = 4
+
+# How long the OAuth callback page may take to build; the token exchange with
+# Google can outlast NiceGUI's default response_timeout of 3 seconds
+OAUTH_CALLBACK_TIMEOUT_SECONDS = 30
+
+# Credentials are refreshed in the background once they expire within the
+# margin, checked on this interval, so page loads rarely wait on a refresh
+CREDENTIALS_REFRESH_MARGIN = timedelta(minutes=5)
+CREDENTIALS_CHECK_SECONDS = 60
+
+# Per-thread authorized HTTP clients; httplib2 connections are not thread-safe
+_thread_local = threading.local()
+
+
+def _execute(request, credentials):
+    """
+    Execute a Google API request on the calling thread's own connection.
+
+    Each worker thread keeps one AuthorizedHttp, so concurrent requests never
+    share an httplib2 connection while sequential ones on a thread reuse it.
+    Transient failures are retried with backoff before an HttpError is raised.
+    """
+    http = getattr(_thread_local, "http", None)
+    if http is None or http.credentials is not credentials:
+        # build_http adds the client library's 60s socket timeout and redirect rules
+        http = AuthorizedHttp(credentials, http=build_http())
+        _thread_local.http = http
+    return request.execute(http=http, num_retries=MAX_RETRIES)
+
+
+async def _gather_in_threads(calls):
+    """
+    Run blocking calls in worker threads, at most MAX_CONCURRENT_REQUESTS at once.
+
+    Args:
+        calls: Zero-argument callables
+
+    Returns:
+        list: Their results, in the same order as the calls
+    """
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
+
+    async def run(call):
+        async with semaphore:
+            return await asyncio.to_thread(call)
+
+    return await asyncio.gather(*(run(call) for call in calls))
+
+
+def _expires_soon(credentials):
+    """Return True when credentials expire within CREDENTIALS_REFRESH_MARGIN."""
+    if credentials.expiry is None:
+        return False
+    # google-auth keeps expiry as a naive UTC datetime
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    return credentials.expiry - now < CREDENTIALS_REFRESH_MARGIN
+
+
+def _credentials_state(credentials):
+    """Return the fields that decide whether credentials need saving again."""
+    return (credentials.token, credentials.refresh_token, credentials.expiry)
+
+
+class App:  # pylint: disable=too-many-instance-attributes
     """
     Main application class handling authentication and API interactions.
 
@@ -43,10 +145,15 @@ class App:
         self.credentials = None  # Single source of truth for credentials
         self.client_secrets_path = Path("client_secrets.json")
         self.auth_flow = None
-        self.credentials_path = Path("stored_credentials.pickle")
+        self.credentials_path = Path("stored_credentials.json")
+        self._saved_state = None  # What the credentials file currently holds
         self._load_stored_credentials()
         self.dark_mode = False  # Add dark mode state
-        self.sorting_criteria = "Alphabetical"
+        self.video_cache = VideoCache()
+        # Built API clients, reused until the credentials object changes
+        self._services = {}
+        self._services_credentials = None
+        self._refresh_lock = asyncio.Lock()
 
     def toggle_dark_mode(self):
         """Toggle dark mode state."""
@@ -56,35 +163,101 @@ class App:
         # 2) Update cookie on client side
         cookie_val = "1" if self.dark_mode else "0"
         ui.run_javascript(f"document.cookie = 'dark_mode={cookie_val};path=/'")
-        print("Toggled dark mode, cookie set to:", cookie_val)
+        logger.debug("Toggled dark mode, cookie set to: %s", cookie_val)
 
     def _load_stored_credentials(self):
-        """Load stored credentials and refresh if needed."""
+        """
+        Load stored credentials.
+
+        Expired credentials are kept as they are; refresh_credentials renews
+        them in the background instead of blocking startup.
+        """
+        self._migrate_pickled_credentials()
         try:
             if self.credentials_path.exists():
-                with open(self.credentials_path, "rb") as f:
-                    credentials = pickle.load(f)
-
-                if credentials and credentials.expired and credentials.refresh_token:
-                    print("Refreshing expired credentials")
-                    credentials.refresh(GRequest())
-                    self.save_credentials(credentials)
-
+                with open(self.credentials_path, encoding="utf-8") as f:
+                    credentials = Credentials.from_authorized_user_info(
+                        json.load(f), SCOPES
+                    )
+                self._saved_state = _credentials_state(credentials)
                 self.credentials = credentials
-                print(
-                    f"Loaded credentials, valid: {bool(credentials and not credentials.expired)}"
-                )
+                logger.info("Loaded credentials, valid: %s", not credentials.expired)
         except Exception as e:  # pylint: disable=broad-except
-            print(f"Error loading credentials: {e}")
+            logger.error("Error loading credentials: %s", e)
             self.credentials_path.unlink(missing_ok=True)
             self.credentials = None
 
+    def _migrate_pickled_credentials(self):
+        """Convert a credentials pickle left by older versions to JSON."""
+        legacy_path = self.credentials_path.with_suffix(".pickle")
+        if self.credentials_path.exists() or not legacy_path.exists():
+            return
+        try:
+            # Only ever read from the file this app wrote itself
+            with open(legacy_path, "rb") as f:
+                credentials = pickle.load(f)
+            if not isinstance(credentials, Credentials):
+                raise TypeError(f"unexpected {type(credentials).__name__}")
+        except Exception as e:  # pylint: disable=broad-except
+            logger.warning("Could not read stored credentials: %s", e)
+            legacy_path.unlink(missing_ok=True)
+            return
+
+        try:
+            self.save_credentials(credentials)
+        except Exception as e:  # pylint: disable=broad-except
+            # Keep the pickle, the only copy, and retry on the next start
+            logger.warning("Could not migrate stored credentials: %s", e)
+            self.credentials = credentials
+            return
+        logger.info("Migrated stored credentials to %s", self.credentials_path)
+        legacy_path.unlink(missing_ok=True)
+
     def save_credentials(self, credentials):
-        """Save credentials to file."""
-        if credentials:
-            print("Saving credentials")
-            with open(self.credentials_path, "wb") as f:
-                pickle.dump(credentials, f)
+        """Save credentials to file atomically, skipping unchanged ones."""
+        if not credentials:
+            return
+        state = _credentials_state(credentials)
+        if state == self._saved_state:
+            return
+
+        logger.debug("Saving credentials")
+        # Write a temp file and rename it over the old one, so a crash
+        # mid-write never leaves a truncated credentials file behind
+        tmp_path = self.credentials_path.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(credentials.to_json())
+            # Get the data onto disk before the rename is
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.credentials_path)
+        self._saved_state = state
+
+    async def refresh_credentials(self):
+        """Refresh expired or soon-to-expire credentials off the event loop."""
+        # The background timer and page loads may both get here; the lock keeps
+        # them from refreshing the same credentials twice
+        async with self._refresh_lock:
+            credentials = self.credentials
+            if not (
+                credentials and credentials.refresh_token and _expires_soon(credentials)
+            ):
+                return
+
+            logger.info("Refreshing credentials")
+            try:
+                await asyncio.to_thread(credentials.refresh, GRequest())
+            except RefreshError as e:
+                # The refresh token was revoked or expired; sign in again
+                logger.warning("Error refreshing credentials: %s", e)
+                self.credentials_path.unlink(missing_ok=True)
+                self.credentials = None
+                return
+            except Exception as e:  # pylint: disable=broad-except
+                # Likely a network problem; keep the credentials for the next try
+                logger.warning("Error refreshing credentials: %s", e)
+                return
+            self.save_credentials(credentials)
 
     def has_client_secrets(self):
         """Check if client_secrets.json file exists."""
@@ -114,7 +287,7 @@ class App:
             base_url = "http://localhost:8080"
 
         redirect_uri = f"{base_url}/oauth2callback"
-        print(f"Redirect URI: {redirect_uri}")
+        logger.debug("Redirect URI: %s", redirect_uri)
 
         self.auth_flow = Flow.from_client_secrets_file(
             self.client_secrets_path,
@@ -131,74 +304,103 @@ class App:
 
     def extract_youtube_urls(self, text):
         """Extract YouTube URLs from text."""
-        if not text:
+        # Every supported URL form contains "youtu"; a substring check is far
+        # cheaper than running the regex over the many tasks without videos
+        if not text or "youtu" not in text:
             return []
 
-        # Match various YouTube URL formats
-        youtube_regex = r"(?:https?:\/\/)?(?:www\.)?(?:youtube\.com\/watch\?v=|youtu\.be\/)([a-zA-Z0-9_-]+)"  # pylint: disable=line-too-long
-        return re.findall(youtube_regex, text)
+        return _YOUTUBE_URL_RE.findall(text)
+
+    async def _get_service(self, name, version):
+        """
+        Return the API client for a service, building it on first use.
+
+        Clients are kept until self.credentials is replaced, so repeated loads
+        skip parsing the discovery document again.
+        """
+        if self._services_credentials is not self.credentials:
+            self._services = {}
+            self._services_credentials = self.credentials
+        service = self._services.get(name)
+        if service is None:
+            # build() reads and parses the discovery document; keep it off the loop
+            service = await asyncio.to_thread(
+                build, name, version, credentials=self.credentials
+            )
+            self._services[name] = service
+        return service
+
+    def _fetch_all_items(self, collection, **kwargs):
+        """
+        Fetch every page of a list request and return all items.
+
+        This blocks on the network, so call it through asyncio.to_thread.
+
+        Args:
+            collection: API collection to list, e.g. service.tasks()
+            **kwargs: Extra arguments for the collection's list() call
+        """
+        items = []
+        page_token = None
+        while True:
+            request = collection.list(pageToken=page_token, **kwargs)
+            response = _execute(request, self.credentials)
+            items.extend(response.get("items", []))
+            page_token = response.get("nextPageToken")
+            if not page_token:
+                return items
 
     async def fetch_tasks_with_videos(self):
         """Fetch all tasks and extract ones with YouTube URLs."""
         if not self.credentials:
             return []
 
-        service = build("tasks", "v1", credentials=self.credentials)
+        service = await self._get_service("tasks", "v1")
         tasks_with_videos = []
 
-        # Get all task lists with pagination
-        tasklists = []
-        page_token = None
-        while True:
-            response = service.tasklists().list(pageToken=page_token).execute()
-            tasklists.extend(response.get("items", []))
-            page_token = response.get("nextPageToken")
-            if not page_token:
-                break
-
-        for tasklist in tasklists:
-            # Get all tasks in the task list with pagination
-            page_token = None
-            while True:
-                response = (
-                    service.tasks()
-                    .list(
-                        tasklist=tasklist["id"], showHidden=True, pageToken=page_token
-                    )
-                    .execute()
-                )
-                tasks = response.get("items", [])
-                for task in tasks:
-                    if task.get("status") == "completed":
-                        continue
+        tasklists = await asyncio.to_thread(
+            self._fetch_all_items, service.tasklists(), fields=TASKLIST_FIELDS
+        )
 
-                    youtube_urls = []
+        # Page through every task list concurrently, so the total wait is the
+        # slowest list rather than the sum of all of them
+        tasks_per_list = await _gather_in_threads(
+            partial(
+                self._fetch_all_items,
+                service.tasks(),
+                tasklist=tasklist["id"],
+                showHidden=True,
+                maxResults=TASKS_PAGE_SIZE,
+                fields=TASK_FIELDS,
+            )
+            for tasklist in tasklists
+        )
 
-                    # Check title and notes for YouTube URLs
-                    youtube_urls.extend(
-                        self.extract_youtube_urls(task.get("title", ""))
-                    )
-                    youtube_urls.extend(
-                        self.extract_youtube_urls(task.get("notes", ""))
-                    )
+        for tasklist, tasks in zip(tasklists, tasks_per_list):
+            for task in tasks:
+                if task.get("status") == "completed":
+                    continue
 
-                    if youtube_urls:
-                        tasks_with_videos.append(
-                            {
-                                "task_list": tasklist["title"],
-                                "task_list_id": tasklist["id"],
-                                "task_id": task["id"],
-                                "task_url": task.get("webViewLink", ""),
-                                "task_title": task.get("title", ""),
-                                "task_notes": task.get("notes", ""),
-                                "youtube_ids": youtube_urls,
-                                "status": task.get("status", ""),
-                                "due": task.get("due", ""),
-                            }
-                        )
-                page_token = response.get("nextPageToken")
-                if not page_token:
-                    break
+                # Check title and notes for YouTube URLs in one scan; the newline
+                # keeps a URL ending the title from running into the notes
+                youtube_urls = self.extract_youtube_urls(
+                    f'{task.get("title", "")}\n{task.get("notes", "")}'
+                )
+
+                if youtube_urls:
+                    tasks_with_videos.append(
+                        {
+                            "task_list": tasklist["title"],
+                            "task_list_id": tasklist["id"],
+                            "task_id": task["id"],
+                            "task_url": task.get("webViewLink", ""),
+                            "task_title": task.get("title", ""),
+                            # The same link often appears in title and notes
+                            "youtube_ids": list(dict.fromkeys(youtube_urls)),
+                            "status": task.get("status", ""),
+                            "due": task.get("due", ""),
+                        }
+                    )
         return tasks_with_videos
 
     async def get_video_details(self, video_ids):
@@ -206,19 +408,34 @@ class App:
         if not self.credentials or not video_ids:
             return {}
 
-        youtube = build("youtube", "v3", credentials=self.credentials)
-        video_details = {}
+        # Each ID only needs to be looked up and requested once
+        video_ids = list(dict.fromkeys(video_ids))
 
-        # Process videos in batches of 50 (API limit)
-        for i in range(0, len(video_ids), 50):
-            batch = video_ids[i : i + 50]
-            request = youtube.videos().list(
-                part="snippet,contentDetails", id=",".join(batch)
+        # Only ask YouTube for videos missing from the cache
+        video_details = await asyncio.to_thread(self.video_cache.get_many, video_ids)
+        missing_ids = [vid for vid in video_ids if vid not in video_details]
+        if not missing_ids:
+            return video_details
+
+        youtube = await self._get_service("youtube", "v3")
+        fetched = {}
+
+        # Request videos in batches of 50 (API limit), several batches at once
+        requests = [
+            youtube.videos().list(
+                part="snippet,contentDetails",
+                id=",".join(missing_ids[i : i + 50]),
+                fields=VIDEO_FIELDS,
             )
-            response = request.execute()
+            for i in range(0, len(missing_ids), 50)
+        ]
+        responses = await _gather_in_threads(
+            partial(_execute, request, self.credentials) for request in requests
+        )
 
+        for response in responses:
             for item in response.get("items", []):
-                video_details[item["id"]] = {
+                fetched[item["id"]] = {
                     "title": item["snippet"]["title"],
                     "thumbnail": item["snippet"]["thumbnails"]["medium"],
                     "channel": item["snippet"]["channelTitle"],
@@ -227,21 +444,22 @@ class App:
                     "publishedAt": item["snippet"]["publishedAt"],
                 }
 
+        await asyncio.to_thread(self.video_cache.put_many, fetched)
+        video_details.update(fetched)
         return video_details
 
 
 app = App()
+ng_app.timer(CREDENTIALS_CHECK_SECONDS, app.refresh_credentials)
 
 
 def store_credentials_in_browser(credentials):
     """
-    Store current credentials in local storage as base64-encoded pickle.
+    Store current credentials in local storage as JSON.
     Note: This can be a security risk. Use carefully.
     """
-    data = pickle.dumps(credentials)
-    encoded = base64.b64encode(data).decode("utf-8")
-    ng_app.storage.browser["yt_credentials"] = encoded
-    print("Stored credentials in browser local storage.")
+    ng_app.storage.browser["yt_credentials"] = credentials.to_json()
+    logger.debug("Stored credentials in browser local storage.")
 
 
 def load_credentials_from_browser():
@@ -250,11 +468,15 @@ def load_credentials_from_browser():
     Returns:
         Credentials object or None if not found
     """
-    encoded = ng_app.storage.browser.get("yt_credentials", None)
-    if encoded:
-        data = base64.b64decode(encoded.encode("utf-8"))
-        loaded = pickle.loads(data)
-        print("Loaded credentials from browser local storage.")
+    stored = ng_app.storage.browser.get("yt_credentials", None)
+    if stored:
+        try:
+            loaded = Credentials.from_authorized_user_info(json.loads(stored), SCOPES)
+        except ValueError as e:
+            # Includes entries left by older versions in another format
+            logger.warning("Ignoring unreadable browser credentials: %s", e)
+            return None
+        logger.debug("Loaded credentials from browser local storage.")
         return loaded
     return None
 
@@ -269,8 +491,6 @@ async def main(request: Request):
     """
     # 3) Read the 'dark_mode' cookie on page load
     dark_mode_cookie = request.cookies.get("dark_mode")
-    sorting_criteria = request.cookies.get("sorting_criteria")
-    app.sorting_criteria = sorting_criteria
     if dark_mode_cookie == "1":
         app.dark_mode = True
     else:
@@ -279,25 +499,32 @@ async def main(request: Request):
     # 4) Apply dark mode based on cookie before continuing
     ui.dark_mode(app.dark_mode)
 
+    # The background timer normally keeps credentials fresh. If they still need
+    # a refresh, serve the page shell first so the round-trip to Google does
+    # not count against the page's response timeout.
+    if app.credentials and _expires_soon(app.credentials):
+        await ui.context.client.connected()
+        await app.refresh_credentials()
+
     # Try loading from browser storage if we don't have valid credentials
     if not (app.credentials and app.is_authenticated()):
         retrieved = load_credentials_from_browser()
-        print("Retrieved credentials from browser storage: ", retrieved)
+        logger.debug("Retrieved credentials from browser storage: %s", retrieved)
         if retrieved and not retrieved.expired and retrieved.valid:
-            print("Using retrieved credentials")
+            logger.debug("Using retrieved credentials")
             app.credentials = retrieved
         else:
-            print("No valid credentials found")
+            logger.debug("No valid credentials found")
 
-    print("Test Is Authenticate? ", app.is_authenticated())
+    logger.debug("Authenticated: %s", app.is_authenticated())
     if app.is_authenticated():
         await show_main_ui(app)
     else:
         await show_login_ui(app, request)
 
 
-@ui.page("/oauth2callback")
-def oauth2callback(request: Request):
+@ui.page("/oauth2callback", response_timeout=OAUTH_CALLBACK_TIMEOUT_SECONDS)
+async def oauth2callback(request: Request):
     """
     OAuth2 callback handler for Google authentication.
 
@@ -307,23 +534,24 @@ def oauth2callback(request: Request):
     Returns:
         RedirectResponse: Redirects to main page after handling authentication
     """
-    print("\n=== OAuth2 Callback Started ===")
+    logger.debug("OAuth2 callback started")
     try:
         params = request.query_params
         code = params.get("code")
         if code:
-            print(f"Received auth code: {code[:10]}...")
+            logger.debug("Received auth code: %s...", code[:10])
         else:
-            print("No code received!")
+            logger.warning("No code received!")
 
         if not app.auth_flow:
-            print("Error: Authentication flow not initialized")
+            logger.error("Authentication flow not initialized")
             return RedirectResponse("/")
 
-        print("Exchanging code for credentials...")
-        app.auth_flow.fetch_token(code=code)
+        logger.debug("Exchanging code for credentials...")
+        # The token exchange is a blocking HTTPS call; keep it off the loop
+        await asyncio.to_thread(app.auth_flow.fetch_token, code=code)
         credentials = app.auth_flow.credentials
-        print(f"Credentials obtained, valid: {credentials.valid}")
+        logger.debug("Credentials obtained, valid: %s", credentials.valid)
 
         app.save_credentials(credentials)
         app.credentials = credentials
@@ -332,17 +560,17 @@ def oauth2callback(request: Request):
         # Store credentials in local storage so a server restart won't break user session
         store_credentials_in_browser(credentials)
 
-        print("Authentication completed successfully")
+        logger.info("Authentication completed successfully")
         return RedirectResponse("/")
-    except Exception as e:  # pylint: disable=broad-except
-        print(f"Authentication error: {str(e)}")
-        print(f"Error type: {type(e)}")
+    except Exception:  # pylint: disable=broad-except
+        logger.exception("Authentication error")
         return RedirectResponse("/")
 
 
 if __name__ in {"__main__", "__mp_main__"}:
     # Step 1) Load environment variables
     dotenv.load_dotenv()
+    logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO").upper())
 
     # Step 2) Check for STORAGE_SECRET in environment
     secret = os.getenv("STORAGE_SECRET")
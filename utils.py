@@ -1,16 +1,53 @@
 """ Utility functions for the YouTube from Google Tasks Browser app ."""
 
 import re
+from functools import lru_cache
+
+# ISO 8601 duration as returned by the YouTube API, e.g. "PT1H2M3S" or "P1DT2H"
+_ISO_DURATION_RE = re.compile(r"P(?:(\d+)D)?(?:T(?:(\d+)H)?(?:(\d+)M)?(?:(\d+)S)?)?$")
+
+
+@lru_cache(maxsize=4096)
+def _duration_parts(duration):
+    """
+    Split an ISO 8601 duration into whole hours, minutes and seconds.
+
+    Days are folded into hours. Returns None if the string is not a duration.
+    """
+    match = _ISO_DURATION_RE.match(duration)
+    if not match:
+        return None
+
+    # Missing units come back as "0"
+    days, hours, minutes, seconds = map(int, match.groups("0"))
+    return days * 24 + hours, minutes, seconds
 
 
 def calculate_duration_seconds(duration_str):
     """Parse YouTube duration string and return total seconds."""
-    match = re.match(r"PT(?:(\d+)H)?(?:(\d+)M)?(?:(\d+)S)?", duration_str)
-    if not match:
+    parts = _duration_parts(duration_str)
+    if not parts:
         return 0
 
-    hours = int(match.group(1) or 0)
-    minutes = int(match.group(2) or 0)
-    seconds = int(match.group(3) or 0)
-
+    hours, minutes, seconds = parts
     return hours * 3600 + minutes * 60 + seconds
+
+
+def parse_duration(duration):
+    """Convert ISO 8601 duration to human readable format."""
+    parts = _duration_parts(duration)
+    if not parts:
+        return "Unknown"
+
+    if not any(parts):
+        # Zero durations keep their long-standing labels: "Unknown" without a
+        # time part (YouTube reports "P0D" for live streams), else the units
+        # spelled out, such as "0s" for "PT0S" and nothing for "PT"
+        if not duration.startswith("PT"):
+            return "Unknown"
+        time_units = _ISO_DURATION_RE.match(duration).groups()[1:]
+        return " ".join(
+            f"{value}{unit}" for value, unit in zip(time_units, "hms") if value
+        )
+
+    return " ".join(f"{value}{unit}" for value, unit in zip(parts, "hms") if value)
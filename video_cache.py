@@ -0,0 +1,77 @@
+"""Persistent cache of YouTube video details for the YouTube Tasks Browser app."""
+
+import json
+import sqlite3
+import time
+from contextlib import closing
+from pathlib import Path
+
+# Video details rarely change, so keep them for 30 days
+DEFAULT_TTL_SECONDS = 30 * 24 * 3600
+
+# Stay well below SQLite's limit on bound parameters per statement
+_QUERY_CHUNK = 500
+
+
+class VideoCache:
+    """
+    SQLite-backed cache of video details keyed by video ID.
+
+    Every call opens its own connection, so the cache can be used from
+    worker threads via asyncio.to_thread.
+    """
+
+    def __init__(self, path=Path("video_cache.db"), ttl_seconds=DEFAULT_TTL_SECONDS):
+        self.path = Path(path)
+        self.ttl_seconds = ttl_seconds
+
+    def _connect(self):
+        """Open a connection, creating the table on first use."""
+        conn = sqlite3.connect(self.path)
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS videos ("
+            "video_id TEXT PRIMARY KEY, json TEXT NOT NULL, fetched_at INTEGER NOT NULL)"
+        )
+        return conn
+
+    def get_many(self, video_ids):
+        """
+        Look up cached details that have not expired.
+
+        Returns:
+            dict: Video details keyed by video ID, for the IDs that were found
+        """
+        cutoff = int(time.time()) - self.ttl_seconds
+        found = {}
+        with closing(self._connect()) as conn:
+            for i in range(0, len(video_ids), _QUERY_CHUNK):
+                chunk = video_ids[i : i + _QUERY_CHUNK]
+                placeholders = ",".join("?" * len(chunk))
+                rows = conn.execute(
+                    f"SELECT video_id, json FROM videos "
+                    f"WHERE fetched_at >= ? AND video_id IN ({placeholders})",
+                    (cutoff, *chunk),
+                )
+                for video_id, data in rows:
+                    found[video_id] = json.loads(data)
+        return found
+
+    def put_many(self, video_details):
+        """Store freshly fetched details, replacing any older entries."""
+        now = int(time.time())
+        with closing(self._connect()) as conn:
+            with conn:  # Commit as one transaction
+                conn.executemany(
+                    "INSERT OR REPLACE INTO videos (video_id, json, fetched_at) "
+                    "VALUES (?, ?, ?)",
+                    [
+                        (video_id, json.dumps(details), now)
+                        for video_id, details in video_details.items()
+                    ],
+                )
+
+    def clear(self):
+        """Drop every cached entry."""
+        with closing(self._connect()) as conn:
+            with conn:
+                conn.execute("DELETE FROM videos")